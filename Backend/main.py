@@ -1,28 +1,58 @@
 # Import required FastAPI and utility libraries
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from contextlib import asynccontextmanager
 import uvicorn
 import os
+import asyncio
+import uuid
+from itertools import islice
 from dotenv import load_dotenv
-import shutil
+import aiofiles
 
 # Import our custom services for PDF processing, embeddings, and AI functionality
-from services.pdf_processor import extract_text_from_pdf, chunk_text
-from services.embeddings import get_embeddings
-from services.chroma_utils import add_to_db, get_all_documents, get_document_chunks, delete_document
-from services.gemini_utils import generate_initial_question, generate_followup_question
+from services.pdf_processor import iter_pdf_pages, iter_chunks
+from services.embeddings import aget_embeddings, EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+from services.vector_store import add_to_db, flush, get_all_documents, get_document_chunks, delete_document
+from services.gemini_utils import (
+    generate_initial_question, generate_followup_question,
+    stream_initial_question, stream_followup_question
+)
+from services import embedding_cache, gemini_client, pdf_processor
 
 # Load environment variables from .env file (API keys, configuration)
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Application lifespan - runs once at startup and once at shutdown
+    
+    Shared services (vector database client, embedding cache, Gemini client) are
+    created once when their modules are imported. In single-worker runs the hashes
+    of all cached embeddings are loaded into memory at startup, so uploads skip
+    SQLite for chunks that were never embedded. At shutdown pending vector
+    index changes are written, the pooled Gemini connections are closed and the
+    PDF worker processes are stopped.
+    """
+    cached_count = await asyncio.to_thread(embedding_cache.preload)
+    if cached_count is not None:
+        print(f"Embedding cache warmed with {cached_count} entries")
+    yield
+    await asyncio.to_thread(flush)
+    await gemini_client.aclose()
+    await asyncio.to_thread(pdf_processor.shutdown)
+
 # Initialize FastAPI application with metadata
 app = FastAPI(
     title="Recallify API",  # Updated from "Entaract" to match new repository name
     description="AI Teaching Assistant - PDF Processing and Learning API",
-    version="1.0.0"
+    version="1.0.0",
+    # Default JSON responses: ORJSONResponse is deprecated in current FastAPI, and
+    # without embeddings in the responses the payloads are plain text
+    lifespan=lifespan
 )
 
 # Configure CORS middleware to allow frontend communication
@@ -35,12 +65,161 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Size of each piece read from an uploaded file while streaming it to disk (1 MiB)
+UPLOAD_READ_SIZE = 1 << 20
+
+# Maximum number of batches waiting between two stages of the upload pipeline
+PIPELINE_QUEUE_SIZE = 4
+
+# Number of embedded chunks collected before they are written to the vector database
+INSERT_BATCH_SIZE = 500
+
+async def process_pdf(temp_path, document_id, filename=None):
+    """
+    Extract, chunk, embed and store a PDF as a pipeline of overlapping stages
+
+    Args:
+        temp_path (str): Path of the uploaded PDF on disk
+        document_id (str): Identifier of the uploaded document
+        filename (str, optional): Original file name, stored with every chunk
+
+    Returns:
+        tuple: (text, chunks) for the whole document
+
+    Pipeline:
+        1. Parser: reads pages and cuts them into chunks, EMBED_BATCH_SIZE at a time
+        2. Embedder: embeds batches (cache misses only), up to EMBED_CONCURRENCY at a time
+        3. Inserter: writes embedded chunks to the vector database every INSERT_BATCH_SIZE chunks
+
+    Note:
+        Stages are connected by bounded queues, so a fast parser waits for the embedder
+        instead of buffering the whole document, and total time approaches that of the
+        slowest stage rather than the sum of all stages. Batches may finish embedding
+        in any order but are stored in document order. The first failing batch or
+        stage cancels the whole pipeline.
+    """
+    batch_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    # Holds the embedding task of each batch in document order, so chunks are stored in order
+    embedded_queue = asyncio.Queue(maxsize=EMBED_CONCURRENCY)
+
+    pages = []
+    chunks = []
+
+    stages = []
+    errors = []
+
+    def fail(error):
+        # Stop every stage on the first error, so no further batches are sent for embedding
+        if not errors:
+            errors.append(error)
+            for stage in stages:
+                stage.cancel()
+
+    def read_pages():
+        # Keep each page so the full text can be returned to the client
+        for page in iter_pdf_pages(temp_path):
+            pages.append(page)
+            yield page
+
+    chunk_iter = iter_chunks(read_pages())
+
+    async def parse():
+        # Parsing is CPU-bound, so each batch is produced in a worker thread
+        while batch := await asyncio.to_thread(lambda: list(islice(chunk_iter, EMBED_BATCH_SIZE))):
+            await batch_queue.put((len(chunks), batch))
+            chunks.extend(batch)
+        await batch_queue.put(None)
+
+    async def embed():
+        # Several batches are embedded concurrently; their tasks are passed on in order
+        slots = asyncio.Semaphore(EMBED_CONCURRENCY)
+        running = set()
+
+        def batch_done(task):
+            slots.release()
+            running.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                fail(task.exception())
+
+        try:
+            while (item := await batch_queue.get()) is not None:
+                await slots.acquire()
+                start, batch = item
+                task = asyncio.create_task(aget_embeddings(batch, document_id, start))
+                running.add(task)
+                task.add_done_callback(batch_done)
+                await embedded_queue.put(task)
+        except BaseException:
+            for task in list(running):
+                task.cancel()
+            raise
+        await embedded_queue.put(None)
+
+    async def store(embedded):
+        # A running worker thread can't be interrupted, so a write that has started is
+        # allowed to finish before cancellation proceeds; cleanup then sees all its chunks
+        write = asyncio.ensure_future(asyncio.to_thread(add_to_db, embedded, document_id, False, filename))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            await asyncio.wait([write])
+            raise
+
+    async def insert():
+        pending = []
+        while (task := await embedded_queue.get()) is not None:
+            # Vectors are dropped once stored, so memory stays bounded by the queues
+            pending.extend(await task)
+            if len(pending) >= INSERT_BATCH_SIZE:
+                await store(pending)
+                pending = []
+        if pending:
+            await store(pending)
+
+    async def run(stage):
+        try:
+            await stage()
+        except Exception as e:
+            fail(e)
+            raise
+
+    stages.extend(asyncio.create_task(run(stage)) for stage in (parse, embed, insert))
+    # Cancelled stages end with CancelledError; the first real error is re-raised below
+    await asyncio.gather(*stages, return_exceptions=True)
+    if errors:
+        raise errors[0]
+
+    # Persist the stored chunks once for the whole upload
+    await asyncio.to_thread(flush)
+
+    return "\n".join(pages), chunks
+
+async def server_sent_events(parts):
+    """
+    Format streamed text as server-sent events
+
+    Args:
+        parts (async iterable): Pieces of text, e.g. from stream_initial_question
+
+    Yields:
+        str: One "data:" event per piece, then a "done" event
+             (an "error" event instead if generation fails part-way)
+    """
+    try:
+        async for part in parts:
+            # Each line of the piece becomes a data line; the client joins them with "\n"
+            yield "".join(f"data: {line}\n" for line in part.split("\n")) + "\n"
+        yield "event: done\ndata: \n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {str(e)}\n\n"
+
 # Pydantic models for API request/response validation
 class FollowupQuestionRequest(BaseModel):
     """Request model for generating follow-up questions in teaching sessions"""
     user_answer: str  # The student's answer to the previous question
     previous_question: str  # The AI's previous question for context
     conversation_history: list = []  # Optional conversation history for better context
+    no_cache: bool = False  # Always generate a new question instead of reusing a cached one
 
 # API Routes
 # ===========
@@ -64,6 +243,14 @@ async def health_check():
         "message": "API is operational"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """
+    Embedding cache counters for monitoring
+    Returns: Dictionary with exact, normalized and fuzzy cache hits and misses (in chunks)
+    """
+    return {"embedding_cache": embedding_cache.get_stats()}
+
 @app.post("/api/upload-pdf")
 async def upload_pdf(file: UploadFile = File(...)):
     """
@@ -74,35 +261,55 @@ async def upload_pdf(file: UploadFile = File(...)):
         
     Returns:
         Dictionary containing:
+        - document_id: Identifier of the stored document
+        - filename: Name of the uploaded file
         - text: Extracted text from PDF
         - chunks: Text split into manageable chunks
-        - embedded_chunks: Chunks with vector embeddings for AI processing
+        - chunks_count: Number of chunks stored
+        - total_characters: Length of the extracted text
+        
+    Note:
+        Embedding vectors are only needed server-side and are not sent back,
+        which keeps the response small.
         
     Raises:
         HTTPException: If PDF processing fails or file is invalid
     """
     try:
-        # Create temporary file for PDF processing
-        temp_path = f"temp_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Unique identifier grouping all chunks of this upload
+        document_id = uuid.uuid4().hex
 
-        # Extract text content from PDF using pdfminer
-        text = extract_text_from_pdf(temp_path)
-        
-        # Clean up temporary file immediately after processing
-        os.remove(temp_path)
+        # Create temporary file for PDF processing
+        # Named after the document ID, so concurrent uploads of the same file name
+        # never share (or delete) each other's temp file
+        # The upload is streamed to disk in fixed-size pieces with async file I/O, so memory
+        # use stays bounded regardless of PDF size and the event loop stays free
+        temp_path = f"temp_{document_id}.pdf"
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while piece := await file.read(UPLOAD_READ_SIZE):
+                await buffer.write(piece)
 
-        # Split text into smaller chunks for better AI processing
-        chunks = chunk_text(text)
-        
-        # Generate vector embeddings for semantic search and AI understanding
-        embedded_chunks = get_embeddings(chunks)
+        try:
+            # Extract text, split it into chunks, generate vector embeddings and store
+            # them in the vector database as overlapping pipeline stages
+            # (previously embedded chunks are served from the embedding cache)
+            text, chunks = await process_pdf(temp_path, document_id, file.filename)
+        except Exception:
+            # Don't leave a partially stored document behind
+            await asyncio.to_thread(delete_document, document_id)
+            raise
+        finally:
+            # Clean up temporary file once processing is done
+            os.remove(temp_path)
         
-        # Store embeddings in ChromaDB vector database
-        add_to_db(embedded_chunks)
-        
-        return {"text": text, "chunks": chunks, "embedded_chunks": embedded_chunks}
+        return {
+            "document_id": document_id,
+            "filename": file.filename,
+            "text": text,
+            "chunks": chunks,
+            "chunks_count": len(chunks),
+            "total_characters": len(text)
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
@@ -118,7 +325,7 @@ async def get_documents():
         HTTPException: If database query fails
     """
     try:
-        documents = get_all_documents()
+        documents = await asyncio.to_thread(get_all_documents)
         return {"documents": documents}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching documents: {str(e)}")
@@ -138,7 +345,7 @@ async def get_document_chunks_route(document_id: str):
         HTTPException: If document not found or database error
     """
     try:
-        chunks = get_document_chunks(document_id)
+        chunks = await asyncio.to_thread(get_document_chunks, document_id)
         if chunks:
             return chunks
         else:
@@ -161,7 +368,7 @@ async def delete_document_route(document_id: str):
         HTTPException: If document not found or deletion fails
     """
     try:
-        success = delete_document(document_id)
+        success = await asyncio.to_thread(delete_document, document_id)
         if success:
             return {"success": True, "message": "Document deleted successfully"}
         else:
@@ -170,11 +377,14 @@ async def delete_document_route(document_id: str):
         raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
 
 @app.get("/api/gemini/generate-question")
-async def generate_question():
+async def generate_question(no_cache: bool = False):
     """
     Generate an initial question for starting a teaching session
     Uses Gemini AI to create contextual questions based on uploaded document content
     
+    Args:
+        no_cache: Generate a new question instead of reusing a cached one
+        
     Returns:
         Dictionary containing the generated question
         
@@ -182,11 +392,27 @@ async def generate_question():
         HTTPException: If AI service fails or no content available
     """
     try:
-        question = generate_initial_question()
+        # Vector store and Gemini calls are blocking, so they run in a worker thread
+        question = await asyncio.to_thread(generate_initial_question, no_cache)
         return {"question": question}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating question: {str(e)}")
 
+@app.get("/api/gemini/generate-question/stream")
+async def generate_question_stream(no_cache: bool = False):
+    """
+    Streaming version of /api/gemini/generate-question
+    The question is sent as server-sent events while Gemini generates it, so the
+    frontend can show the first words before the whole question is ready
+    
+    Args:
+        no_cache: Generate a new question instead of reusing a cached one
+        
+    Returns:
+        text/event-stream response with the question text
+    """
+    return StreamingResponse(server_sent_events(stream_initial_question(no_cache)), media_type="text/event-stream")
+
 @app.post("/api/gemini/followup-question")
 async def generate_followup(request: FollowupQuestionRequest):
     """
@@ -203,15 +429,36 @@ async def generate_followup(request: FollowupQuestionRequest):
         HTTPException: If AI service fails or request is invalid
     """
     try:
-        question = generate_followup_question(
+        question = await asyncio.to_thread(
+            generate_followup_question,
             user_answer=request.user_answer,
             previous_question=request.previous_question,
-            conversation_history=request.conversation_history
+            conversation_history=request.conversation_history,
+            no_cache=request.no_cache
         )
         return {"question": question}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating follow-up question: {str(e)}")
 
+@app.post("/api/gemini/followup-question/stream")
+async def generate_followup_stream(request: FollowupQuestionRequest):
+    """
+    Streaming version of /api/gemini/followup-question, sent as server-sent events
+    
+    Args:
+        request: Contains user's answer, previous question, and conversation history
+        
+    Returns:
+        text/event-stream response with the follow-up question text
+    """
+    parts = stream_followup_question(
+        user_answer=request.user_answer,
+        previous_question=request.previous_question,
+        conversation_history=request.conversation_history,
+        no_cache=request.no_cache
+    )
+    return StreamingResponse(server_sent_events(parts), media_type="text/event-stream")
+
 # Application entry point
 if __name__ == "__main__":
     # Start the FastAPI server with uvicorn
@@ -2,9 +2,24 @@
 """
 Simple run script for the Entaract backend server
 """
+import os
 import uvicorn
 
 if __name__ == "__main__":
+    # Several worker processes let uploads and question generation run on all CPU cores.
+    # The embedded vector stores (ChromaDB PersistentClient, FAISS) are single-process,
+    # so multiple workers are only the default when ChromaDB runs as a server (CHROMA_HOST).
+    # The FAISS index lives in each process's memory, so FAISS always defaults to one worker
+    uses_faiss = os.getenv("VECTOR_STORE", "chroma").lower() == "faiss"
+    default_workers = "4" if os.getenv("CHROMA_HOST") and not uses_faiss else "1"
+    workers = int(os.getenv("WEB_CONCURRENCY", default_workers))
+    # Worker processes read this to know whether they share their caches with others
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    
+    # Auto-reload is for development and always runs a single worker,
+    # so it stays on by default only for single-worker runs
+    reload = os.getenv("RELOAD", "true" if workers == 1 else "false").lower() == "true"
+
     print("🚀 Starting Entaract Backend Server...")
     print("📄 API Documentation: http://localhost:8000/docs")
     print("🔧 Health Check: http://localhost:8000/health")
@@ -15,6 +30,7 @@ if __name__ == "__main__":
         "main:app",  # Import string instead of app object
         host="0.0.0.0",
         port=8000,
-        reload=True,  # Auto-reload on code changes
+        reload=reload,  # Auto-reload on code changes (RELOAD=true)
+        workers=None if reload else workers,
         log_level="info"
     ) 
\ No newline at end of file
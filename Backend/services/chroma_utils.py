@@ -2,14 +2,77 @@
 # Handles storage, retrieval, and management of document embeddings in ChromaDB
 # ChromaDB is optimized for vector similarity search and semantic retrieval
 
+import os
+import sqlite3
+import threading
+from itertools import islice
+
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 
+from . import document_summaries
+
 # Initialize ChromaDB client and create/get collection for lecture notes
 # Collections in ChromaDB are like tables in traditional databases
-client = chromadb.Client()
+# When CHROMA_HOST is set, connect to a separate ChromaDB server (e.g. started with
+# `chroma run --path ./chroma_db --port 8001`) so indexing and persistence run in their
+# own process instead of competing with the API for the GIL.
+# Otherwise the embedded persistent client keeps embeddings on disk so uploads survive restarts
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_DIR = os.getenv("CHROMA_DIR", "./chroma_db")
+if CHROMA_HOST:
+    client = chromadb.HttpClient(host=CHROMA_HOST, port=int(os.getenv("CHROMA_PORT", "8001")))
+else:
+    client = chromadb.PersistentClient(path=CHROMA_DIR)
 collection = client.get_or_create_collection(name="lecture_notes")
 
+# Per-document totals for the document list, kept in a SQLite sidecar
+# (next to the API, also when ChromaDB runs as a separate server)
+os.makedirs(CHROMA_DIR, exist_ok=True)
+_summary_lock = threading.Lock()
+_summary_conn = sqlite3.connect(
+    os.getenv("CHROMA_SUMMARY_DB", os.path.join(CHROMA_DIR, "documents.sqlite3")), check_same_thread=False
+)
+_summary_conn.execute("PRAGMA journal_mode=WAL")
+document_summaries.create_table(_summary_conn)
+
+# Maximum number of chunks sent to ChromaDB in a single add() call
+# Large uploads are split into sub-batches of this size, capped at the largest
+# batch the ChromaDB backend accepts
+ADD_BATCH_SIZE = min(int(os.getenv("CHROMA_ADD_BATCH_SIZE", "1000")), client.get_max_batch_size())
+
+# Incremented on every write, so cached reads can tell when the stored content changed
+collection_version = 0
+
+
+def _bump_version():
+    """Mark the stored content as changed"""
+    global collection_version
+    collection_version += 1
+
+
+def get_collection_version():
+    """
+    Return the current content version of the store
+    
+    Returns:
+        int: Counter that changes whenever documents are added, deleted or cleared
+             (tracked per process)
+    """
+    return collection_version
+
+
+
+def flush():
+    """
+    Write pending changes to disk
+
+    Note:
+        ChromaDB persists every write itself, so there is nothing to do; this exists
+        so both vector store backends offer the same interface.
+    """
+
 
 def clear_collection():
     """
@@ -27,13 +90,17 @@ def clear_collection():
         This operation is irreversible. All stored embeddings and metadata will be lost.
     """
     try:
-        # Retrieve all document IDs currently in the collection
-        result = collection.get()
+        # Delete by a filter every chunk matches instead of fetching every ID first;
+        # ChromaDB removes the data without loading it into Python. The collection
+        # itself is kept, since other worker processes and threads hold its handle
+        count = collection.count()
+        collection.delete(where={"source": {"$ne": "__never__"}})
+        with _summary_lock:
+            document_summaries.clear(_summary_conn)
         
-        if result["ids"]:
-            # Delete all documents by their IDs
-            collection.delete(ids=result["ids"])
-            print(f"Cleared {len(result['ids'])} documents from collection")
+        if count:
+            print(f"Cleared {count} documents from collection")
+        _bump_version()
         
         return True
     except Exception as e:
@@ -41,7 +108,7 @@ def clear_collection():
         return False
 
 
-def add_to_db(embedding_list, clear_first=True):
+def add_to_db(embedding_list, document_id=None, clear_first=False, filename=None):
     """
     Add document embeddings to the ChromaDB collection
     
@@ -49,30 +116,59 @@ def add_to_db(embedding_list, clear_first=True):
         embedding_list (list): List of embedding dictionaries containing:
                               - id: Unique identifier
                               - text: Original text content
-                              - embedding: Vector representation
-        clear_first (bool): Whether to clear existing documents before adding new ones
-                           Default: True (replaces all content)
+                              - embedding: Vector representation (float32 array or list)
+        document_id (str, optional): Identifier of the uploaded document the chunks
+                                     belong to; stored in each chunk's metadata
+        clear_first (bool): Whether to remove existing content before adding new chunks
+                           Default: False (new content is added alongside existing documents)
+                           With a document_id only that document's chunks are replaced,
+                           without one the whole collection is cleared
+        filename (str, optional): Original file name, stored in each chunk's metadata
     
     Process:
-        1. Optionally clear existing content
-        2. Add each embedding with its text and metadata
+        1. Optionally clear existing content (scoped to document_id when given)
+        2. Add (or replace) embeddings with their text and metadata in batches of ADD_BATCH_SIZE
         3. Store in vector database for similarity search
         
     Note:
         ChromaDB automatically handles vector indexing for fast similarity queries
     """
-    # Clear existing documents if requested (default behavior)
+    # Clear existing documents if requested
     if clear_first:
-        clear_collection()
-    
-    # Add each embedding to the collection
-    for embedding_data in embedding_list:
-        collection.add(
-            documents=[embedding_data["text"]],      # Original text for retrieval
-            embeddings=[embedding_data["embedding"]], # Vector for similarity search
-            ids=[embedding_data["id"]],              # Unique identifier
-            metadatas=[{"source": "lecture_pdf"}]    # Metadata for filtering/organization
+        if document_id:
+            collection.delete(where={"document_id": document_id})
+            with _summary_lock:
+                document_summaries.remove(_summary_conn, document_id)
+        else:
+            clear_collection()
+
+    # Metadata shared by every chunk of this upload
+    metadata = {"source": "lecture_pdf"}
+    if document_id:
+        metadata["document_id"] = document_id
+    if filename:
+        metadata["filename"] = filename
+    
+    # Add embeddings in a few large batches instead of one add() per chunk,
+    # so ChromaDB updates its index and persists once per batch.
+    # Re-adding an existing chunk ID replaces the old entry
+    replaced = []
+    embedding_iter = iter(embedding_list)
+    while batch := list(islice(embedding_iter, ADD_BATCH_SIZE)):
+        existing = collection.get(ids=[e["id"] for e in batch], include=["documents", "metadatas"])
+        replaced.extend(
+            ((metadata or {}).get("document_id") or chunk_id, text)
+            for chunk_id, text, metadata in zip(existing["ids"], existing["documents"], existing["metadatas"])
         )
+        collection.upsert(
+            documents=[e["text"] for e in batch],           # Original text for retrieval
+            embeddings=np.asarray([e["embedding"] for e in batch], dtype=np.float32),  # Vectors for similarity search
+            ids=[e["id"] for e in batch],                   # Unique identifiers
+            metadatas=[dict(metadata) for _ in batch]       # Metadata for filtering/organization
+        )
+    with _summary_lock:
+        document_summaries.record(_summary_conn, embedding_list, document_id, filename, replaced=replaced)
+    _bump_version()
 
 
 def get_notes(limit: int):
@@ -107,35 +203,55 @@ def get_all_documents():
     Retrieve all documents with their metadata for frontend display
     
     Returns:
-        list: List of dictionaries containing:
+        list: List of dictionaries, one per uploaded document, containing:
               - document_id: Unique identifier
               - filename: Original file name (if available)
               - source: Document source information
               - content_preview: First 100 characters of content for preview
+              - chunks_count: Number of chunks stored for the document
+              - upload_timestamp: Upload time (seconds since the epoch)
+              - total_characters, total_words: Size of the document's chunk text
               
     Note:
         This function is used by the frontend to display available documents
         and allow users to select specific documents for teaching sessions.
+        The totals are maintained on every insert and delete in the summary table,
+        so the listing is a single SQLite query and ChromaDB is not read at all.
     """
-    # Retrieve all documents with their metadata
-    result = collection.get(include=["documents", "metadatas"])
-    documents = []
-    
-    # Process results if documents exist
-    if result["documents"] and result["ids"]:
-        for i, doc in enumerate(result["documents"]):
-            # Get metadata for this document (with fallbacks for missing data)
-            metadata = result["metadatas"][i] if result["metadatas"] and i < len(result["metadatas"]) else {}
-            
-            # Create document summary for frontend
-            documents.append({
-                "document_id": result["ids"][i],
-                "filename": metadata.get("filename", "unknown"),
-                "source": metadata.get("source", "unknown"),
-                "content_preview": doc[:100] + "..." if len(doc) > 100 else doc
-            })
+    with _summary_lock:
+        return document_summaries.list_documents(_summary_conn)
+
+
+def _backfill_summaries():
+    """
+    Build the summary table from the stored chunks
     
-    return documents
+    Used once for collections created before the summary table existed; chunks
+    without a document_id are listed individually under their own ID.
+    """
+    result = collection.get(include=["documents", "metadatas"])
+    ids = result["ids"] or []
+    metadatas = [m or {} for m in result["metadatas"]] if result["metadatas"] else [{}] * len(ids)
+
+    documents = {}
+    for chunk_id, doc, metadata in zip(ids, result["documents"] or [], metadatas):
+        document_id = metadata.get("document_id")
+        _, _, chunks = documents.setdefault(document_id or chunk_id, (document_id, metadata, []))
+        chunks.append({"id": chunk_id, "text": doc})
+
+    with _summary_lock:
+        for document_id, metadata, chunks in documents.values():
+            chunks.sort(key=lambda chunk: _chunk_position(chunk["id"]))
+            document_summaries.record(
+                _summary_conn, chunks, document_id, metadata.get("filename"), metadata.get("source", "unknown"),
+                backfill=True
+            )
+
+
+def _chunk_position(chunk_id):
+    """Position of a chunk within its document, taken from the "<document_id>:<index>" ID"""
+    _, _, index = chunk_id.rpartition(":")
+    return int(index) if index.isdigit() else 0
 
 
 def get_document_chunks(document_id: str):
@@ -143,12 +259,13 @@ def get_document_chunks(document_id: str):
     Retrieve all content for a specific document by its ID
     
     Args:
-        document_id (str): Unique identifier of the document to retrieve
+        document_id (str): Unique identifier of the document (or of a single chunk)
         
     Returns:
         dict or None: Dictionary containing:
                      - document_id: The requested ID
                      - content: Full text content
+                     - chunks: The document's chunks in order
                      - metadata: Associated metadata
                      Returns None if document not found
     
@@ -156,17 +273,28 @@ def get_document_chunks(document_id: str):
         Used when a user selects a specific document for detailed viewing
         or when starting a teaching session with particular content.
     """
-    # Query ChromaDB for the specific document
+    # Query ChromaDB for every chunk of the document
     result = collection.get(
-        ids=[document_id],
+        where={"document_id": document_id},
         include=["documents", "metadatas"]
     )
     
+    # Fall back to a chunk stored under that exact ID
+    if not result["ids"]:
+        result = collection.get(
+            ids=[document_id],
+            include=["documents", "metadatas"]
+        )
+    
     # Return document data if found
     if result["documents"]:
+        ordered = sorted(zip(result["ids"], result["documents"]), key=lambda item: _chunk_position(item[0]))
+        chunks = [doc for _, doc in ordered]
         return {
             "document_id": document_id,
-            "content": result["documents"][0],
+            # Chunks were cut at '. ' sentence separators, so this restores the original text
+            "content": ". ".join(chunks),
+            "chunks": chunks,
             "metadata": result["metadatas"][0] if result["metadatas"] else {}
         }
     
@@ -189,18 +317,17 @@ def delete_document(document_id: str):
         The operation cannot be undone.
     """
     try:
-        # Attempt to delete the document by ID
+        # Delete every chunk belonging to the document, plus a chunk stored under that exact ID
+        collection.delete(where={"document_id": document_id})
         collection.delete(ids=[document_id])
+        with _summary_lock:
+            document_summaries.remove(_summary_conn, document_id)
+        _bump_version()
         return True
     except Exception:
         # Return False if deletion fails (document not found, connection error, etc.)
         return False
 
 
-
-
-
-
-
-
-
+if document_summaries.is_empty(_summary_conn) and collection.count():
+    _backfill_summaries()
@@ -0,0 +1,144 @@
+# Document Summary Table
+# Per-document totals kept in a small SQLite table next to the vector store, updated on
+# every insert and delete, so listing documents is one SELECT instead of a scan of all chunks
+#
+# The functions take the SQLite connection of the calling store; callers serialize access.
+
+import time
+
+
+def create_table(conn):
+    """Create the documents table if it doesn't exist yet"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS documents (
+            document_id TEXT PRIMARY KEY,
+            filename TEXT,
+            source TEXT NOT NULL,
+            content_preview TEXT NOT NULL,
+            upload_timestamp REAL NOT NULL,
+            chunk_count INTEGER NOT NULL,
+            total_characters INTEGER NOT NULL,
+            total_words INTEGER NOT NULL
+        )
+    """)
+    conn.commit()
+
+
+def preview(text):
+    """First 100 characters of a chunk, as shown in the document list"""
+    return text[:100] + "..." if len(text) > 100 else text
+
+
+def record(conn, embedding_list, document_id=None, filename=None, source="lecture_pdf", backfill=False,
+           replaced=()):
+    """
+    Add stored chunks to the totals of their document
+
+    Args:
+        conn (sqlite3.Connection): Connection of the calling store
+        embedding_list (list): Stored chunk dictionaries (id, text, ...)
+        document_id (str, optional): Document the chunks belong to; without one every
+                                     chunk is listed as its own document, under its ID
+        filename (str, optional): Original file name
+        source (str): Document source information
+        backfill (bool): Only insert documents that have no summary yet, leaving
+                         existing ones untouched
+        replaced (list): (summary key, text) of stored chunks that the new chunks
+                         replaced; they are taken off the totals of their document
+
+    Note:
+        A document is stored in several batches; the first batch sets the filename,
+        preview and upload time, and later batches only add to the totals.
+        Backfills are insert-only, so several worker processes backfilling the same
+        store at startup can't add a document's chunks to its totals twice.
+    """
+    if document_id:
+        groups = {document_id: embedding_list} if embedding_list else {}
+    else:
+        groups = {e["id"]: [e] for e in embedding_list}
+
+    # Chunks re-added under an existing ID are counted once: the old copy is
+    # subtracted before the new one is added
+    conn.executemany(
+        """
+        UPDATE documents SET
+            chunk_count = chunk_count - 1,
+            total_characters = total_characters - ?,
+            total_words = total_words - ?
+        WHERE document_id = ?
+        """,
+        [(len(text), len(text.split()), key) for key, text in replaced]
+    )
+
+    now = time.time()
+    conn.executemany(
+        """
+        INSERT INTO documents (document_id, filename, source, content_preview, upload_timestamp,
+                               chunk_count, total_characters, total_words)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (document_id) DO
+        """ + ("NOTHING" if backfill else """UPDATE SET
+            chunk_count = chunk_count + excluded.chunk_count,
+            total_characters = total_characters + excluded.total_characters,
+            total_words = total_words + excluded.total_words
+        """),
+        [
+            (
+                key, filename, source, preview(chunks[0]["text"]), now, len(chunks),
+                sum(len(e["text"]) for e in chunks),
+                sum(len(e["text"].split()) for e in chunks)
+            )
+            for key, chunks in groups.items()
+        ]
+    )
+    if replaced:
+        # A document whose chunks all moved to another document is gone
+        conn.execute("DELETE FROM documents WHERE chunk_count <= 0")
+    conn.commit()
+
+
+def remove(conn, document_id):
+    """Drop the summary of a document (or of a chunk listed under its own ID)"""
+    conn.execute("DELETE FROM documents WHERE document_id = ?", [document_id])
+    conn.commit()
+
+
+def clear(conn):
+    """Drop all document summaries"""
+    conn.execute("DELETE FROM documents")
+    conn.commit()
+
+
+def is_empty(conn):
+    """Return True if no document summaries are stored"""
+    return conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+
+def list_documents(conn):
+    """
+    Return all document summaries in upload order
+
+    Returns:
+        list: Dictionaries with document_id, filename, source, content_preview,
+              chunks_count, upload_timestamp, total_characters and total_words
+    """
+    rows = conn.execute("""
+        SELECT document_id, filename, source, content_preview, chunk_count,
+               upload_timestamp, total_characters, total_words
+        FROM documents ORDER BY upload_timestamp, rowid
+    """).fetchall()
+
+    return [
+        {
+            "document_id": document_id,
+            "filename": filename or "unknown",
+            "source": source,
+            "content_preview": content_preview,
+            "chunks_count": chunk_count,
+            "upload_timestamp": upload_timestamp,
+            "total_characters": total_characters,
+            "total_words": total_words
+        }
+        for (document_id, filename, source, content_preview, chunk_count,
+             upload_timestamp, total_characters, total_words) in rows
+    ]
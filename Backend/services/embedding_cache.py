@@ -0,0 +1,346 @@
+# Embedding Cache Service
+# Persists chunk embeddings in SQLite keyed by the SHA-256 of model, task type and chunk text
+# so re-uploaded PDFs and repeated slides never pay for the same embedding twice
+#
+# Chunks that miss the exact lookup can still reuse an embedding when they are
+# near-duplicates of a cached chunk:
+#   1. same text after normalization (case, whitespace and punctuation ignored)
+#   2. rapidfuzz ratio of at least FUZZY_THRESHOLD against a recently stored chunk
+#      of another document
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# Location of the cache database (kept next to the backend by default)
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+
+# Minimum similarity (0-100) for reusing the embedding of a near-duplicate chunk
+# Set to 100 or more to disable fuzzy matching
+FUZZY_THRESHOLD = float(os.getenv("FUZZY_THRESHOLD", "95"))
+
+# Number of recently seen normalized chunks kept in memory for fuzzy matching
+FUZZY_CANDIDATES = 1024
+
+# Encoding of stored vectors, recorded per row so both kinds can coexist:
+# float32 as produced by the model, or int8 with a per-vector float32 scale (4x smaller)
+FLOAT32 = 0
+INT8 = 1
+
+# Encoding used for new entries: "int8" (default) or "none" to keep full float32 vectors
+ENCODING = FLOAT32 if os.getenv("EMBEDDING_CACHE_QUANTIZATION", "int8").lower() == "none" else INT8
+
+# A single shared connection guarded by a lock; uploads run in worker threads
+_lock = threading.Lock()
+_conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+_conn.execute("PRAGMA journal_mode=WAL")
+# Entries of the first cache format were keyed by text only; they can't be
+# attributed to a model, so that table is dropped
+_conn.execute("DROP TABLE IF EXISTS embeddings")
+_conn.execute("""
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        hash BLOB PRIMARY KEY,
+        model TEXT NOT NULL,
+        dim INTEGER NOT NULL,
+        vec BLOB NOT NULL,
+        norm_hash BLOB,
+        encoding INTEGER NOT NULL DEFAULT 0
+    )
+""")
+# Caches created by earlier versions lack the newer columns; existing rows are float32
+_columns = [row[1] for row in _conn.execute("PRAGMA table_info(embedding_cache)")]
+if "norm_hash" not in _columns:
+    _conn.execute("ALTER TABLE embedding_cache ADD COLUMN norm_hash BLOB")
+if "encoding" not in _columns:
+    _conn.execute("ALTER TABLE embedding_cache ADD COLUMN encoding INTEGER NOT NULL DEFAULT 0")
+_conn.execute("CREATE INDEX IF NOT EXISTS embedding_cache_norm_hash ON embedding_cache (norm_hash)")
+_conn.commit()
+
+# Recently stored chunks for fuzzy matching: normalized text -> (norm_hash, document_id),
+# oldest first
+_recent = OrderedDict()
+
+# Number of server worker processes sharing the cache file (uvicorn reads the same
+# variable as its --workers default; run.py sets it)
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Hashes of all cached chunks, loaded by preload() at startup and kept up to date on
+# every store, so chunks that were never embedded are rejected without a SQLite query
+# (None until preloaded, and always with several workers; every lookup then goes to SQLite)
+_known_hashes = None
+
+# Lookup counters since process start, reported by the /metrics endpoint
+_stats = {"exact_hits": 0, "normalized_hits": 0, "fuzzy_hits": 0, "misses": 0}
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def hash_text(text, model, task_type):
+    """
+    Compute the cache key for a chunk of text
+
+    Args:
+        text (str): Chunk text
+        model (str): Embedding model ID
+        task_type (str): Embedding task type
+
+    Returns:
+        bytes: SHA-256 digest of "model|task_type|text"
+
+    Note:
+        Including the model and task type means switching models never returns
+        vectors from a different embedding space.
+    """
+    return hashlib.sha256(f"{model}|{task_type}|{text}".encode("utf-8")).digest()
+
+
+def normalize(text):
+    """
+    Reduce a chunk to the form used to detect near-duplicates
+
+    Args:
+        text (str): Chunk text
+
+    Returns:
+        str: Lowercased text with punctuation removed and whitespace collapsed
+    """
+    # One regex pass removes punctuation runs; split() and join() then collapse and
+    # trim whitespace in C, instead of a second regex pass and a strip()
+    return " ".join(_PUNCTUATION.sub("", text.lower()).split())
+
+
+def _remember(normalized, norm_hash, document_id):
+    """Add a chunk to the fuzzy-match candidates, evicting the oldest (caller holds _lock)"""
+    _recent[normalized] = (norm_hash, document_id)
+    _recent.move_to_end(normalized)
+    if len(_recent) > FUZZY_CANDIDATES:
+        _recent.popitem(last=False)
+
+
+def _encode(vec):
+    """
+    Serialize a float32 vector using ENCODING
+
+    Returns:
+        tuple: (blob, encoding); int8 blobs hold the float32 scale followed by the codes
+    """
+    if ENCODING == INT8:
+        # Symmetric per-vector quantization: the largest component maps to +-127
+        scale = np.float32(np.abs(vec).max() / 127) or np.float32(1)
+        codes = np.round(vec / scale).astype(np.int8)
+        return scale.tobytes() + codes.tobytes(), INT8
+    return vec.tobytes(), FLOAT32
+
+
+def _decode(blob, encoding):
+    """Turn a stored blob back into a float32 vector"""
+    if encoding == INT8:
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def _select(column, keys):
+    """
+    Fetch the vectors whose column value is one of keys (caller holds _lock)
+
+    Returns:
+        dict: Mapping of column value -> embedding (float32 np.ndarray)
+    """
+    found = {}
+    # Query in slices to stay under SQLite's bound-parameter limit
+    for start in range(0, len(keys), 500):
+        batch = keys[start:start + 500]
+        placeholders = ",".join("?" * len(batch))
+        rows = _conn.execute(
+            f"SELECT {column}, vec, encoding FROM embedding_cache WHERE {column} IN ({placeholders})", batch
+        ).fetchall()
+        for key, blob, encoding in rows:
+            found[key] = _decode(blob, encoding)
+    return found
+
+
+def preload():
+    """
+    Load the hashes of all cached chunks into memory
+
+    Returns:
+        int or None: Number of cached chunks, or None if several workers share the cache
+
+    Note:
+        Called once at application startup. With several worker processes the set is
+        not loaded: entries another worker adds later would be missing from it, and
+        every re-upload handled here would pay for those embeddings again.
+    """
+    global _known_hashes
+
+    if WORKERS > 1:
+        return None
+
+    with _lock:
+        _known_hashes = {row[0] for row in _conn.execute("SELECT hash FROM embedding_cache")}
+        return len(_known_hashes)
+
+
+def lookup(hashes):
+    """
+    Fetch cached embeddings for a list of chunk hashes
+
+    Args:
+        hashes (list): Digests produced by hash_text
+
+    Returns:
+        dict: Mapping of hash -> embedding (float32 np.ndarray) for every hash
+              found in the cache. Missing hashes are simply absent.
+    """
+    with _lock:
+        candidates = set(hashes) if _known_hashes is None else _known_hashes.intersection(hashes)
+        found = _select("hash", list(candidates)) if candidates else {}
+        _stats["exact_hits"] += len(found)
+
+    return found
+
+
+def _could_match(a, b):
+    """
+    Cheap upper bound check: fuzz.ratio is at most 200 * min(len) / (len(a) + len(b)),
+    so strings whose lengths differ too much can never reach FUZZY_THRESHOLD
+    """
+    return 200 * min(len(a), len(b)) >= FUZZY_THRESHOLD * (len(a) + len(b))
+
+
+def lookup_near(texts, model, task_type, document_id=None):
+    """
+    Find reusable embeddings for chunks that missed the exact lookup
+
+    Args:
+        texts (dict): Mapping of hash -> chunk text for the exact-lookup misses
+        model (str): Embedding model ID
+        task_type (str): Embedding task type
+        document_id (str, optional): Document being embedded; its own chunks are not
+                                     fuzzy-match candidates, since chunks of one document
+                                     often differ only in details such as numbers
+
+    Returns:
+        dict: Mapping of hash -> embedding for every chunk whose normalized text is
+              cached, or that is at least FUZZY_THRESHOLD similar to a recently stored
+              chunk of another document. Chunks without a match are counted as misses.
+
+    Note:
+        Fuzzy scoring runs on a snapshot of the candidates without holding the lock,
+        so it never blocks other lookups and stores.
+    """
+    normalized = {h: normalize(text) for h, text in texts.items()}
+    norm_hashes = {h: hash_text(norm, model, task_type) for h, norm in normalized.items()}
+    found = {}
+
+    with _lock:
+        # Same text after normalization
+        by_norm_hash = _select("norm_hash", list(set(norm_hashes.values())))
+        for h, norm_hash in norm_hashes.items():
+            if norm_hash in by_norm_hash:
+                found[h] = by_norm_hash[norm_hash]
+        _stats["normalized_hits"] += len(found)
+
+        # Snapshot of the fuzzy-match candidates from other documents
+        candidates = []
+        if FUZZY_THRESHOLD < 100:
+            candidates = [
+                (norm, norm_hash) for norm, (norm_hash, owner) in _recent.items()
+                if document_id is None or owner != document_id
+            ]
+
+    # Close enough to a recently stored chunk
+    matches = {}
+    for h in texts.keys() - found.keys() if candidates else ():
+        shortlist = [candidate for candidate in candidates if _could_match(normalized[h], candidate[0])]
+        if shortlist:
+            match = process.extractOne(
+                normalized[h], [norm for norm, _ in shortlist], scorer=fuzz.ratio, score_cutoff=FUZZY_THRESHOLD
+            )
+            if match:
+                matches[h] = shortlist[match[2]][1]
+
+    with _lock:
+        by_fuzzy = _select("norm_hash", list(set(matches.values()))) if matches else {}
+        for h, norm_hash in matches.items():
+            if norm_hash in by_fuzzy:
+                found[h] = by_fuzzy[norm_hash]
+                _stats["fuzzy_hits"] += 1
+
+        _stats["misses"] += len(texts) - len(found)
+
+    return found
+
+
+def store(hash_value, text, vec, model, task_type, document_id=None):
+    """
+    Save a single embedding in the cache
+
+    Args:
+        hash_value (bytes): Digest produced by hash_text
+        text (str): Chunk text the vector belongs to
+        vec (np.ndarray or list): Embedding vector
+        model (str): Embedding model ID the vector came from
+        task_type (str): Embedding task type the vector came from
+        document_id (str, optional): Document the chunk belongs to
+    """
+    store_many([(hash_value, text, vec)], model, task_type, document_id)
+
+
+def store_many(items, model, task_type, document_id=None):
+    """
+    Save several embeddings in the cache in one transaction
+
+    Args:
+        items (list): (hash, chunk text, embedding) triples
+        model (str): Embedding model ID the vectors came from
+        task_type (str): Embedding task type the vectors came from
+        document_id (str, optional): Document the chunks belong to; they become
+                                     fuzzy-match candidates for other documents only
+
+    Note:
+        Vectors are stored packed (numpy tobytes), by default as int8 codes with a
+        per-vector scale: a quarter of the size of float32, with each component
+        off by at most half a quantization step. The hash of the normalized text is stored
+        alongside for near-duplicate lookups. Only vectors produced by the model belong
+        here, never ones reused from lookup_near.
+    """
+    rows = []
+    candidates = []
+    for key, text, vec in items:
+        vec = np.asarray(vec, dtype=np.float32)
+        normalized = normalize(text)
+        norm_hash = hash_text(normalized, model, task_type)
+        blob, encoding = _encode(vec)
+        rows.append((key, model, vec.shape[0], blob, norm_hash, encoding))
+        candidates.append((normalized, norm_hash))
+
+    with _lock:
+        _conn.executemany(
+            "INSERT OR REPLACE INTO embedding_cache (hash, model, dim, vec, norm_hash, encoding) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        _conn.commit()
+        if _known_hashes is not None:
+            _known_hashes.update(row[0] for row in rows)
+        for normalized, norm_hash in candidates:
+            _remember(normalized, norm_hash, document_id)
+
+
+def get_stats():
+    """
+    Return the cache lookup counters since process start
+
+    Returns:
+        dict: Number of chunks served by exact_hits, normalized_hits and fuzzy_hits,
+              and the number of misses that had to be embedded
+    """
+    with _lock:
+        return dict(_stats)
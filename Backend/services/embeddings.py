@@ -3,17 +3,32 @@
 # These embeddings enable the AI to understand document content contextually
 
 import os
-from dotenv import load_dotenv
+import asyncio
+import random
+import numpy as np
 
-from google import genai
-from google.genai import types
+from google.genai import errors, types
 
+from . import embedding_cache
+from .gemini_client import client
 
+# Model configuration - using experimental model for better performance
+EMBEDDING_MODEL_ID = "models/gemini-embedding-exp-03-07"
+TASK_TYPE_ID = "RETRIEVAL_DOCUMENT"  # Optimized for document search and retrieval
 
-load_dotenv()
+# The Gemini API accepts at most 100 contents per embedding request
+MAX_EMBED_BATCH_SIZE = 100
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-client = genai.Client(api_key=GOOGLE_API_KEY)
+# Number of chunks sent to the embedding API in a single request
+# Defaults to the API maximum, since embedding is bound by request round-trips
+EMBED_BATCH_SIZE = max(1, min(int(os.getenv("EMBED_BATCH_SIZE", str(MAX_EMBED_BATCH_SIZE))), MAX_EMBED_BATCH_SIZE))
+
+# Maximum number of embedding requests in flight at once for one document
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "8"))
+
+# Retry policy for rate-limited (429) or temporarily unavailable (503) requests
+EMBED_MAX_RETRIES = 5
+EMBED_RETRY_BASE_DELAY = 1.0  # Seconds; doubled after every failed attempt
 
 
 def embed_text(chunk):
@@ -24,8 +39,8 @@ def embed_text(chunk):
         chunk (str): Text chunk to convert into vector representation
         
     Returns:
-        list: Vector embedding as a list of float values
-              (typically 768 or 1024 dimensions depending on model)
+        np.ndarray: Vector embedding as a float32 array
+                    (typically 768 or 1024 dimensions depending on model)
         
     Raises:
         Exception: If embedding generation fails or API error occurs
@@ -35,54 +50,158 @@ def embed_text(chunk):
         - Task type set to RETRIEVAL_DOCUMENT for optimal performance with academic content
         - Returns dense vector representation that captures semantic meaning
     """
-    # Model configuration - using experimental model for better performance
-    EMBEDDING_MODEL_ID = "models/gemini-embedding-exp-03-07"
-    TASK_TYPE_ID = "RETRIEVAL_DOCUMENT"  # Optimized for document search and retrieval
+    return embed_texts([chunk])[0]
+
+
+def embed_texts(chunks):
+    """
+    Generate vector embeddings for several text chunks with a single API request
     
-    # Call Gemini API to generate embedding
+    Args:
+        chunks (list): Text chunks to convert into vector representations
+        
+    Returns:
+        np.ndarray: float32 matrix of shape (len(chunks), dimensions),
+                    one embedding row per chunk in the same order
+        
+    Raises:
+        Exception: If embedding generation fails or the API returns fewer vectors than chunks
+    """
+    # Call Gemini API with all chunks of the batch as separate contents
     response = client.models.embed_content(
         model=EMBEDDING_MODEL_ID,
-        contents=chunk,
+        contents=chunks,
         config=types.EmbedContentConfig(task_type=TASK_TYPE_ID)
     )
 
     # Extract embedding values from response
-    if response.embeddings and len(response.embeddings) > 0:
-        return response.embeddings[0].values
+    if response.embeddings and len(response.embeddings) == len(chunks):
+        # One contiguous float32 block instead of lists of boxed Python floats
+        return np.asarray([embedding.values for embedding in response.embeddings], dtype=np.float32)
     else:
         raise Exception(f"Failed to get embeddings: {response}")
 
 
+async def aembed_batch(chunks):
+    """
+    Async version of embed_texts, retrying with exponential backoff when rate limited
+    
+    Args:
+        chunks (list): Text chunks to convert into vector representations (one API request)
+        
+    Returns:
+        np.ndarray: float32 matrix with one embedding row per chunk
+        
+    Raises:
+        errors.APIError: If the request still fails after EMBED_MAX_RETRIES retries
+        Exception: If the API returns fewer vectors than chunks
+    """
+    delay = EMBED_RETRY_BASE_DELAY
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            # Non-blocking Gemini call, so other batches and requests proceed while waiting
+            response = await client.aio.models.embed_content(
+                model=EMBEDDING_MODEL_ID,
+                contents=chunks,
+                config=types.EmbedContentConfig(task_type=TASK_TYPE_ID)
+            )
+            break
+        except errors.APIError as e:
+            if e.code not in (429, 503) or attempt == EMBED_MAX_RETRIES:
+                raise
+            # Back off exponentially, with jitter so parallel batches don't retry in lockstep
+            await asyncio.sleep(delay + random.uniform(0, delay))
+            delay *= 2
 
-def get_embeddings(chunked_text):
+    if response.embeddings and len(response.embeddings) == len(chunks):
+        return np.asarray([embedding.values for embedding in response.embeddings], dtype=np.float32)
+    else:
+        raise Exception(f"Failed to get embeddings: {response}")
+
+
+def chunk_id(document_id, index):
+    """
+    Build the ID of a chunk: "<document_id>:<index>", or "chunk_<index>" without a document
+    """
+    return f"{document_id}:{index}" if document_id else f"chunk_{index}"
+
+
+async def aget_embeddings(chunked_text, document_id=None, start=0):
     """
     Process multiple text chunks and generate embeddings for each
     
     Args:
         chunked_text (list): List of text chunks from PDF processing
+        document_id (str, optional): Identifier of the document the chunks belong to,
+                                     used to build per-document chunk IDs
+        start (int): Position of the first chunk within the document (default 0)
         
     Returns:
         list: List of dictionaries containing:
               - id: Unique identifier for the chunk
               - text: Original text content
-              - embedding: Vector representation of the text
+              - embedding: Vector representation of the text (float32 np.ndarray)
               
     Note:
-        This function processes chunks sequentially. For large documents,
-        consider implementing batch processing or async calls for better performance.
+        Vectors are looked up in the persistent embedding cache first, by exact text
+        and then by near-duplicate text; only the distinct texts that miss both are
+        sent to the API, and their vectors are cached.
+        Misses go out in batches of EMBED_BATCH_SIZE (configurable via the
+        environment), up to EMBED_CONCURRENCY requests concurrently, so network
+        wait time overlaps instead of adding up.
     """
-    embeddings = []
-    
-    # Process each chunk individually
-    for i, chunk in enumerate(chunked_text):
-        # Generate embedding for this chunk
-        embedded_data = embed_text(chunk)
-        
-        # Store chunk with its metadata and embedding
-        embeddings.append({
-            "id": f"chunk_{i}",          # Sequential ID for easy tracking
-            "text": chunk,               # Original text for reference and display
-            "embedding": embedded_data   # Vector representation for similarity search
-        })
-    
-    return embeddings
\ No newline at end of file
+    hashes = [embedding_cache.hash_text(chunk, EMBEDDING_MODEL_ID, TASK_TYPE_ID) for chunk in chunked_text]
+    vectors = await asyncio.to_thread(embedding_cache.lookup, hashes)
+
+    # Collect the distinct texts that are not cached yet; repeated headers, footers
+    # and slide templates only need to be embedded once
+    uncached = {}
+    for chunk, h in zip(chunked_text, hashes):
+        if h not in vectors:
+            uncached.setdefault(h, chunk)
+
+    # Near-duplicates of earlier uploads (e.g. a re-exported slide deck with small edits)
+    # reuse the cached vector. The reused vectors are not stored under the new chunks:
+    # they would become exact hits and fuzzy-match candidates themselves, letting later
+    # matches chain past FUZZY_THRESHOLD
+    if uncached:
+        near = await asyncio.to_thread(
+            embedding_cache.lookup_near, uncached, EMBEDDING_MODEL_ID, TASK_TYPE_ID, document_id
+        )
+        for h in near:
+            del uncached[h]
+        vectors.update(near)
+
+    if uncached:
+        misses = list(uncached.values())
+        semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+        async def embed_batch(batch):
+            async with semaphore:
+                return await aembed_batch(batch)
+
+        # Fire all batch requests at once; the semaphore bounds how many are in flight
+        batch_embeddings = await asyncio.gather(
+            *(embed_batch(misses[i:i + EMBED_BATCH_SIZE]) for i in range(0, len(misses), EMBED_BATCH_SIZE))
+        )
+        new_vectors = dict(zip(uncached, (row for batch in batch_embeddings for row in batch)))
+
+        # Remember the results for next time
+        await asyncio.to_thread(
+            embedding_cache.store_many,
+            [(h, uncached[h], vec) for h, vec in new_vectors.items()],
+            EMBEDDING_MODEL_ID,
+            TASK_TYPE_ID,
+            document_id
+        )
+        vectors.update(new_vectors)
+
+    # Store each chunk with its metadata and embedding, in the original order
+    return [
+        {
+            "id": chunk_id(document_id, i),  # Sequential ID for easy tracking
+            "text": chunk,                   # Original text for reference and display
+            "embedding": vectors[h]          # Vector representation for similarity search
+        }
+        for i, (chunk, h) in enumerate(zip(chunked_text, hashes), start=start)
+    ]
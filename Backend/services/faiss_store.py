@@ -0,0 +1,386 @@
+# FAISS Vector Store
+# Alternative storage backend with the same interface as chroma_utils
+# Vectors live in a FAISS inner-product index, text and metadata in a SQLite sidecar table
+#
+# Enable with VECTOR_STORE=faiss. Bulk inserts become a single contiguous
+# index.add_with_ids() call instead of ChromaDB's per-write persistence cycle.
+
+import json
+import os
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+
+from . import document_summaries
+
+# Storage location for the index file and the SQLite sidecar
+FAISS_DIR = os.getenv("FAISS_DIR", "./faiss_store")
+INDEX_PATH = os.path.join(FAISS_DIR, "index.faiss")
+DB_PATH = os.path.join(FAISS_DIR, "chunks.sqlite3")
+
+# Vector encoding for newly created indexes: "int8" (default), "fp16" or "none" (float32)
+# Quantized codes cut index memory and disk size by 4x (int8) or 2x (fp16)
+QUANTIZATION = os.getenv("FAISS_QUANTIZATION", "int8").lower()
+
+os.makedirs(FAISS_DIR, exist_ok=True)
+
+# FAISS indexes and the shared SQLite connection are not thread-safe on their own;
+# API handlers call into this module from worker threads, so all access is serialized
+_lock = threading.Lock()
+
+# Text and metadata for every stored chunk
+# int_id is the FAISS vector ID, id is the public string chunk ID
+_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+_conn.execute("PRAGMA journal_mode=WAL")
+_conn.execute("""
+    CREATE TABLE IF NOT EXISTS chunks (
+        int_id INTEGER PRIMARY KEY,
+        id TEXT UNIQUE NOT NULL,
+        document_id TEXT,
+        text TEXT NOT NULL,
+        metadata TEXT NOT NULL
+    )
+""")
+_conn.execute("CREATE INDEX IF NOT EXISTS chunks_document_id ON chunks (document_id)")
+_conn.commit()
+document_summaries.create_table(_conn)
+
+# The index is created lazily on first insert, once the embedding dimension is known
+index = faiss.read_index(INDEX_PATH) if os.path.exists(INDEX_PATH) else None
+
+# True while the in-memory index has changes that are not written to disk yet
+_dirty = False
+
+# Incremented on every write, so cached reads can tell when the stored content changed
+collection_version = 0
+
+
+def _bump_version():
+    """Mark the stored content as changed"""
+    global collection_version
+    collection_version += 1
+
+
+def get_collection_version():
+    """
+    Return the current content version of the store
+    
+    Returns:
+        int: Counter that changes whenever documents are added, deleted or cleared
+             (tracked per process)
+    """
+    return collection_version
+
+
+def _new_index(dim):
+    """
+    Create an empty ID-mapped inner-product index
+
+    Vectors are L2-normalized before insertion, so inner product equals cosine similarity.
+    Depending on QUANTIZATION the vectors are stored as int8 or fp16 scalar-quantized codes.
+    """
+    if QUANTIZATION == "int8":
+        base = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        # Normalized vectors have every component in [-1, 1], so the quantizer range
+        # is trained on those bounds instead of on real data
+        bounds = np.vstack([-np.ones(dim), np.ones(dim)]).astype(np.float32)
+        base.train(bounds)
+    elif QUANTIZATION == "fp16":
+        base = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    else:
+        base = faiss.IndexFlatIP(dim)
+
+    return faiss.IndexIDMap(base)
+
+
+def _save_index():
+    """
+    Write the in-memory index to disk so it survives restarts (caller holds _lock)
+
+    The index is written to a temporary file that then replaces the old one, so a
+    crash mid-write leaves the previous index intact instead of a corrupt file.
+    """
+    global _dirty
+
+    if index is not None:
+        temp_path = INDEX_PATH + ".tmp"
+        faiss.write_index(index, temp_path)
+        os.replace(temp_path, INDEX_PATH)
+    _dirty = False
+
+
+def flush():
+    """
+    Write pending index changes to disk
+
+    Note:
+        add_to_db only updates the in-memory index, since an upload calls it many
+        times and every save rewrites the whole index file; callers flush once
+        when the upload is complete. Deletes and clears are saved immediately.
+    """
+    with _lock:
+        if _dirty:
+            _save_index()
+
+
+def _drop_unindexed_rows():
+    """
+    Remove chunks whose vectors never reached the saved index
+
+    After a crash between add_to_db and flush, SQLite holds rows for vectors the
+    index on disk lacks. They are deleted, and the document summaries are rebuilt.
+    """
+    indexed = set(faiss.vector_to_array(index.id_map).tolist()) if index is not None else set()
+    orphans = [row[0] for row in _conn.execute("SELECT int_id FROM chunks") if row[0] not in indexed]
+    if orphans:
+        _conn.executemany("DELETE FROM chunks WHERE int_id = ?", [(int_id,) for int_id in orphans])
+        document_summaries.clear(_conn)
+        print(f"Dropped {len(orphans)} chunks missing from the FAISS index")
+
+
+def _remove_rows(where, params):
+    """
+    Delete matching chunks from both SQLite and the FAISS index
+
+    Args:
+        where (str): SQL condition on the chunks table
+        params (list): Parameters for the condition
+
+    Returns:
+        int: Number of chunks removed
+    """
+    int_ids = [row[0] for row in _conn.execute(f"SELECT int_id FROM chunks WHERE {where}", params)]
+    if not int_ids:
+        return 0
+
+    if index is not None:
+        index.remove_ids(np.asarray(int_ids, dtype=np.int64))
+    _conn.execute(f"DELETE FROM chunks WHERE {where}", params)
+    return len(int_ids)
+
+
+def clear_collection():
+    """
+    Remove all documents from the FAISS store
+
+    Returns:
+        bool: True if clearing successful, False otherwise
+
+    Note:
+        This operation is irreversible. All stored embeddings and metadata will be lost.
+    """
+    try:
+        with _lock:
+            count = _conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            _conn.execute("DELETE FROM chunks")
+            document_summaries.clear(_conn)
+            if index is not None:
+                index.reset()
+                _save_index()
+            _bump_version()
+        if count:
+            print(f"Cleared {count} documents from collection")
+        return True
+    except Exception as e:
+        print(f"Error clearing collection: {e}")
+        return False
+
+
+def add_to_db(embedding_list, document_id=None, clear_first=False, filename=None):
+    """
+    Add document embeddings to the FAISS index and their text to the SQLite sidecar
+
+    Args:
+        embedding_list (list): List of embedding dictionaries containing:
+                              - id: Unique identifier
+                              - text: Original text content
+                              - embedding: Vector representation
+        document_id (str, optional): Identifier of the uploaded document the chunks
+                                     belong to; stored in each chunk's metadata
+        clear_first (bool): Whether to remove existing content before adding new chunks
+                           With a document_id only that document's chunks are replaced,
+                           without one the whole store is cleared
+        filename (str, optional): Original file name, stored in each chunk's metadata
+
+    Note:
+        All vectors of the upload are normalized and added in one add_with_ids() call.
+        The index file is only written by flush().
+    """
+    global index, _dirty
+
+    if clear_first and not document_id:
+        clear_collection()
+
+    if not embedding_list:
+        return
+
+    metadata = {"source": "lecture_pdf"}
+    if document_id:
+        metadata["document_id"] = document_id
+    if filename:
+        metadata["filename"] = filename
+    metadata_json = json.dumps(metadata)
+
+    # Stack all vectors into one contiguous float32 matrix
+    vectors = np.asarray([e["embedding"] for e in embedding_list], dtype=np.float32)
+    faiss.normalize_L2(vectors)
+
+    with _lock:
+        if clear_first and document_id:
+            _remove_rows("document_id = ?", [document_id])
+            document_summaries.remove(_conn, document_id)
+
+        # Re-adding an existing chunk ID replaces the old entry
+        ids = [e["id"] for e in embedding_list]
+        replaced = []
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            where = f"id IN ({','.join('?' * len(batch))})"
+            replaced.extend(
+                (row_document_id or chunk_id, text)
+                for chunk_id, row_document_id, text in _conn.execute(
+                    f"SELECT id, document_id, text FROM chunks WHERE {where}", batch
+                )
+            )
+            _remove_rows(where, batch)
+
+        if index is None:
+            index = _new_index(vectors.shape[1])
+
+        # Allocate sequential integer IDs for FAISS
+        next_id = _conn.execute("SELECT COALESCE(MAX(int_id), -1) + 1 FROM chunks").fetchone()[0]
+        int_ids = np.arange(next_id, next_id + len(embedding_list), dtype=np.int64)
+
+        _conn.executemany(
+            "INSERT INTO chunks (int_id, id, document_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+            [
+                (int(int_id), e["id"], document_id, e["text"], metadata_json)
+                for int_id, e in zip(int_ids, embedding_list)
+            ]
+        )
+        index.add_with_ids(vectors, int_ids)
+
+        # Commits the chunk rows together with the document totals
+        document_summaries.record(_conn, embedding_list, document_id, filename, replaced=replaced)
+        _dirty = True
+        _bump_version()
+
+
+def get_notes(limit: int):
+    """
+    Retrieve a limited number of documents from the store for AI context
+
+    Args:
+        limit (int): Maximum number of documents to retrieve
+
+    Returns:
+        str: Combined text from retrieved documents, joined with double line breaks
+    """
+    with _lock:
+        rows = _conn.execute("SELECT text FROM chunks ORDER BY int_id LIMIT ?", [limit]).fetchall()
+
+    return "\n\n".join(row[0] for row in rows)
+
+
+def get_all_documents():
+    """
+    Retrieve all documents with their metadata for frontend display
+
+    Returns:
+        list: List of dictionaries, one per uploaded document, containing:
+              - document_id: Unique identifier
+              - filename: Original file name (if available)
+              - source: Document source information
+              - content_preview: First 100 characters of content for preview
+              - chunks_count: Number of chunks stored for the document
+              - upload_timestamp: Upload time (seconds since the epoch)
+              - total_characters, total_words: Size of the document's chunk text
+
+    Note:
+        Read from the per-document summary table, which is updated on every write.
+    """
+    with _lock:
+        return document_summaries.list_documents(_conn)
+
+
+def _backfill_summaries():
+    """
+    Build the summary table from the stored chunks
+
+    Used once for stores created before the summary table existed; chunks
+    without a document_id are listed individually under their own ID.
+    """
+    with _lock:
+        rows = _conn.execute("SELECT id, document_id, text, metadata FROM chunks ORDER BY int_id").fetchall()
+
+        documents = {}
+        for chunk_id, document_id, text, metadata_json in rows:
+            _, _, chunks = documents.setdefault(document_id or chunk_id, (document_id, metadata_json, []))
+            chunks.append({"id": chunk_id, "text": text})
+
+        for document_id, metadata_json, chunks in documents.values():
+            metadata = json.loads(metadata_json)
+            document_summaries.record(
+                _conn, chunks, document_id, metadata.get("filename"), metadata.get("source", "unknown"),
+                backfill=True
+            )
+
+
+def get_document_chunks(document_id: str):
+    """
+    Retrieve all content for a specific document by its ID
+
+    Args:
+        document_id (str): Unique identifier of the document (or of a single chunk)
+
+    Returns:
+        dict or None: Dictionary containing document_id, content, chunks and metadata,
+                      or None if the document is not found
+    """
+    with _lock:
+        rows = _conn.execute(
+            "SELECT text, metadata FROM chunks WHERE document_id = ? ORDER BY int_id", [document_id]
+        ).fetchall()
+        if not rows:
+            rows = _conn.execute("SELECT text, metadata FROM chunks WHERE id = ?", [document_id]).fetchall()
+
+    if rows:
+        chunks = [row[0] for row in rows]
+        return {
+            "document_id": document_id,
+            # Chunks were cut at '. ' sentence separators, so this restores the original text
+            "content": ". ".join(chunks),
+            "chunks": chunks,
+            "metadata": json.loads(rows[0][1])
+        }
+
+    return None
+
+
+def delete_document(document_id: str):
+    """
+    Remove a specific document and its vectors from the store
+
+    Args:
+        document_id (str): Unique identifier of the document to delete
+
+    Returns:
+        bool: True if deletion successful, False if an error occurred
+    """
+    try:
+        with _lock:
+            # Delete every chunk belonging to the document, plus a chunk stored under that exact ID
+            _remove_rows("document_id = ? OR id = ?", [document_id, document_id])
+            document_summaries.remove(_conn, document_id)
+            _save_index()
+            _bump_version()
+        return True
+    except Exception:
+        return False
+
+
+_drop_unindexed_rows()
+if document_summaries.is_empty(_conn) and _conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+    _backfill_summaries()
@@ -0,0 +1,33 @@
+# Gemini API Client
+# A single Gemini client shared by the embedding and question generation services,
+# backed by pooled keep-alive HTTP connections
+
+import os
+import dotenv
+import httpx
+
+from google import genai
+from google.genai import types
+
+dotenv.load_dotenv()
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+# Connection pool limits and request timeout (seconds) for calls to the Gemini API
+_limits = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+_timeout = 30
+
+# Shared HTTP/2 connection pools (one for sync calls, one for async calls)
+# Keeping connections alive means only the first request pays the TCP + TLS handshake
+_http = httpx.Client(http2=True, limits=_limits, timeout=_timeout)
+_ahttp = httpx.AsyncClient(http2=True, limits=_limits, timeout=_timeout)
+
+client = genai.Client(
+    api_key=GOOGLE_API_KEY,
+    http_options=types.HttpOptions(httpx_client=_http, httpx_async_client=_ahttp)
+)
+
+
+async def aclose():
+    """Close both connection pools (called at application shutdown)"""
+    await _ahttp.aclose()
+    _http.close()
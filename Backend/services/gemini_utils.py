@@ -2,41 +2,28 @@
 # Implements intelligent question generation for interactive teaching sessions
 # The AI acts as a curious student asking thoughtful questions based on document content
 
-import os
-import dotenv
+import asyncio
+import hashlib
+import threading
 
-from google import genai
-from google.genai import types
-from .chroma_utils import get_notes
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
+from . import response_cache
+from .embeddings import aembed_batch, embed_text
+from .gemini_client import client
+from .vector_store import get_notes, get_collection_version
 
-dotenv.load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-client = genai.Client(api_key=GOOGLE_API_KEY)
+# Model used to generate questions
+GENERATION_MODEL_ID = "gemini-2.5-flash"
 
-def generate_initial_question():
-    """
-    Generate the first question to start a teaching session
-    
-    This function creates an engaging opening question based on the uploaded document content.
-    The AI is prompted to act as a curious student who wants to learn from the user (teacher).
-    
-    Returns:
-        str: A thoughtful, open-ended question that encourages explanation and discussion
-        
-    Teaching Philosophy:
-        - Questions are designed to help users reinforce their knowledge by teaching
-        - Focuses on understanding rather than memorization
-        - Encourages elaboration and real-world connections
-        - Adapts to the specific content of uploaded documents
-        
-    Question Types Generated:
-        - Comprehension: "Can you explain how [concept] works?"
-        - Application: "How would you apply [principle] in [scenario]?"
-        - Analysis: "Why do you think [phenomenon] occurs?"
-        - Synthesis: "How does [concept A] relate to [concept B]?"
-    """
-    training_data = get_notes(10)
-    prompt = f"""You are an AI model acting as a curious and proactive student.
+# Lecture notes only change when the vector database does, so they are cached per
+# collection version. The version is tracked per process; the TTL bounds staleness
+# when several workers share one ChromaDB server.
+_notes_cache = TTLCache(maxsize=4, ttl=60)
+
+# Prompt templates, filled in with str.format_map; only the notes and the
+# conversation change between calls
+_INITIAL_PROMPT_TEMPLATE = """You are an AI model acting as a curious and proactive student.
             Your job is to help the user (your teacher) review a topic by asking thoughtful, open-ended questions.
             You have access to a vector database containing relevant information from lecture notes, textbooks, or course materials.
             Based on that data, generate questions that:
@@ -70,15 +57,190 @@ def generate_initial_question():
             {training_data}
             """
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
+_FOLLOWUP_PROMPT_TEMPLATE = """You are an AI student having a learning conversation with your teacher.
+    
+    The teacher just answered your question: "{previous_question}"
+    Their answer was: "{user_answer}"
+    
+    Based on their answer and the course material, generate a thoughtful follow-up question that:
+    
+    1. Acknowledges their answer (show you understood/learned from it)
+    2. Builds upon what they explained 
+    3. Asks for deeper understanding, examples, or clarification
+    4. Demonstrates genuine curiosity as a student would
+    5. Helps them reinforce their knowledge by teaching more
+    
+    Guidelines:
+    - Be conversational and appreciative of their teaching
+    - Ask only ONE question at a time
+    - Make it specific to their answer and the course material
+    - Vary between asking for examples, applications, explanations, or connections
+    - Sound like an engaged student, not a teacher testing them
+    
+    Course Material:
+    {training_data}
+    
+    Previous Conversation Context:
+    {conversation_context}
+    
+    Generate a natural follow-up question:"""
+
+
+@cached(_notes_cache, key=lambda limit: hashkey(get_collection_version(), limit), lock=threading.Lock())
+def get_cached_notes(limit: int):
+    """
+    Return get_notes(limit), reusing the result until the collection changes
+    
+    Args:
+        limit (int): Maximum number of documents to retrieve
+        
+    Returns:
+        str: Combined text of the retrieved documents
+    """
+    return get_notes(limit)
+
+
+def _generate_question(prompt, kind, cache_key, request_text, no_cache=False):
+    """
+    Generate a question with Gemini, reusing the response to a near-identical recent request
+    
+    Args:
+        prompt (str): Complete prompt sent to the model
+        kind (str): Question type ("initial" or "followup"), keeps cache entries apart
+        cache_key (str): Parts of the prompt that must match exactly (the lecture notes,
+                         and for followups the conversation so far)
+        request_text (str or None): Part of the request that is embedded and compared;
+                                    None when the cache key alone determines the prompt
+        no_cache (bool): Always call Gemini (when a new question is wanted) and skip the cache
+        
+    Returns:
+        str: Generated question text
+        
+    Note:
+        Cache entries are partitioned by question type and cache key, so only
+        requests about the same material (and conversation) can share a response.
+    """
+    if no_cache:
+        return client.models.generate_content(model=GENERATION_MODEL_ID, contents=prompt).text
+
+    namespace = _cache_namespace(kind, cache_key)
+    embedding = embed_text(request_text) if request_text is not None else None
+
+    cached_response = response_cache.lookup(namespace, embedding)
+    if cached_response is not None:
+        return cached_response
+
+    response = client.models.generate_content(model=GENERATION_MODEL_ID, contents=prompt)
+    response_cache.store(namespace, embedding, response.text)
 
     return response.text
 
 
-def generate_followup_question(user_answer: str, previous_question: str, conversation_history=None):
+async def _astream_question(prompt, kind, cache_key, request_text, no_cache=False):
+    """
+    Streaming version of _generate_question, yielding the question as Gemini produces it
+    
+    Yields:
+        str: Consecutive pieces of the question text (the whole text at once on a cache hit)
+        
+    Note:
+        The complete streamed question is added to the semantic response cache.
+    """
+    if not no_cache:
+        namespace = _cache_namespace(kind, cache_key)
+        embedding = (await aembed_batch([request_text]))[0] if request_text is not None else None
+
+        cached_response = await asyncio.to_thread(response_cache.lookup, namespace, embedding)
+        if cached_response is not None:
+            yield cached_response
+            return
+
+    parts = []
+    async for chunk in await client.aio.models.generate_content_stream(model=GENERATION_MODEL_ID, contents=prompt):
+        if chunk.text:
+            parts.append(chunk.text)
+            yield chunk.text
+
+    if not no_cache:
+        await asyncio.to_thread(response_cache.store, namespace, embedding, "".join(parts))
+
+
+def _cache_namespace(kind, cache_key):
+    """Response cache partition for a question type and the exactly matched parts of its prompt"""
+    return f"{kind}:{hashlib.sha256(cache_key.encode('utf-8')).hexdigest()}"
+
+
+def generate_initial_question(no_cache=False):
+    """
+    Generate the first question to start a teaching session
+    
+    This function creates an engaging opening question based on the uploaded document content.
+    The AI is prompted to act as a curious student who wants to learn from the user (teacher).
+    
+    Args:
+        no_cache (bool): Generate a fresh question instead of reusing a cached one
+        
+    Returns:
+        str: A thoughtful, open-ended question that encourages explanation and discussion
+        
+    Teaching Philosophy:
+        - Questions are designed to help users reinforce their knowledge by teaching
+        - Focuses on understanding rather than memorization
+        - Encourages elaboration and real-world connections
+        - Adapts to the specific content of uploaded documents
+        
+    Note:
+        The generated question is stored in the response cache under a hash of the
+        notes, so repeated session starts on unchanged notes don't call Gemini again,
+        in any worker process, until the cache entry expires.
+        
+    Question Types Generated:
+        - Comprehension: "Can you explain how [concept] works?"
+        - Application: "How would you apply [principle] in [scenario]?"
+        - Analysis: "Why do you think [phenomenon] occurs?"
+        - Synthesis: "How does [concept A] relate to [concept B]?"
+    """
+    return _initial_question(no_cache)
+
+
+def _initial_question(no_cache):
+    """Build the initial question prompt and generate the question"""
+    prompt, training_data = _initial_prompt()
+
+    # The prompt depends on the notes only, which the namespace already covers,
+    # so the cache is looked up by namespace without embedding the prompt
+    return _generate_question(prompt, "initial", training_data, None, no_cache)
+
+
+async def stream_initial_question(no_cache=False):
+    """
+    Streaming version of generate_initial_question
+    
+    Args:
+        no_cache (bool): Generate a fresh question instead of reusing a cached one
+        
+    Yields:
+        str: Consecutive pieces of the question text
+    """
+    prompt, training_data = await asyncio.to_thread(_initial_prompt)
+    async for part in _astream_question(prompt, "initial", training_data, None, no_cache):
+        yield part
+
+
+def _initial_prompt():
+    """
+    Build the prompt for the opening question of a session
+    
+    Returns:
+        tuple: (prompt, lecture notes included in it)
+    """
+    training_data = get_cached_notes(10)
+    prompt = _INITIAL_PROMPT_TEMPLATE.format_map({"training_data": training_data})
+
+    return prompt, training_data
+
+
+def generate_followup_question(user_answer: str, previous_question: str, conversation_history=None, no_cache=False):
     """
     Generate contextual follow-up questions based on the user's responses
     
@@ -89,6 +251,7 @@ def generate_followup_question(user_answer: str, previous_question: str, convers
         user_answer (str): The user's response to the previous question
         previous_question (str): The question that was just answered
         conversation_history (list, optional): Previous exchanges for context
+        no_cache (bool): Generate a fresh question instead of reusing a cached one
         
     Returns:
         str: A follow-up question that acknowledges the answer and builds upon it
@@ -105,7 +268,38 @@ def generate_followup_question(user_answer: str, previous_question: str, convers
         - If answer shows misconception: Guide toward correct understanding
         - If answer is correct: Explore related concepts or edge cases
     """
-    training_data = get_notes(10)
+    prompt, cache_key = _followup_prompt(user_answer, previous_question, conversation_history)
+    return _generate_question(prompt, "followup", cache_key, user_answer, no_cache)
+
+
+async def stream_followup_question(user_answer: str, previous_question: str, conversation_history=None, no_cache=False):
+    """
+    Streaming version of generate_followup_question
+    
+    Args:
+        user_answer (str): The user's response to the previous question
+        previous_question (str): The question that was just answered
+        conversation_history (list, optional): Previous exchanges for context
+        no_cache (bool): Generate a fresh question instead of reusing a cached one
+        
+    Yields:
+        str: Consecutive pieces of the question text
+    """
+    prompt, cache_key = await asyncio.to_thread(
+        _followup_prompt, user_answer, previous_question, conversation_history
+    )
+    async for part in _astream_question(prompt, "followup", cache_key, user_answer, no_cache):
+        yield part
+
+
+def _followup_prompt(user_answer, previous_question, conversation_history):
+    """
+    Build the prompt for a follow-up question
+    
+    Returns:
+        tuple: (prompt, response cache key of the notes and conversation in it)
+    """
+    training_data = get_cached_notes(10)
     
     conversation_context = ""
     if conversation_history:
@@ -114,40 +308,18 @@ def generate_followup_question(user_answer: str, previous_question: str, convers
             for msg in conversation_history[-3:]
         ])
     
-    prompt = f"""You are an AI student having a learning conversation with your teacher.
-    
-    The teacher just answered your question: "{previous_question}"
-    Their answer was: "{user_answer}"
-    
-    Based on their answer and the course material, generate a thoughtful follow-up question that:
-    
-    1. Acknowledges their answer (show you understood/learned from it)
-    2. Builds upon what they explained 
-    3. Asks for deeper understanding, examples, or clarification
-    4. Demonstrates genuine curiosity as a student would
-    5. Helps them reinforce their knowledge by teaching more
-    
-    Guidelines:
-    - Be conversational and appreciative of their teaching
-    - Ask only ONE question at a time
-    - Make it specific to their answer and the course material
-    - Vary between asking for examples, applications, explanations, or connections
-    - Sound like an engaged student, not a teacher testing them
-    
-    Course Material:
-    {training_data}
-    
-    Previous Conversation Context:
-    {conversation_context}
-    
-    Generate a natural follow-up question:"""
+    prompt = _FOLLOWUP_PROMPT_TEMPLATE.format_map({
+        "previous_question": previous_question,
+        "user_answer": user_answer,
+        "training_data": training_data,
+        "conversation_context": conversation_context
+    })
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
-
-    return response.text
+    # The notes, the conversation and the question being answered must match exactly;
+    # only the answer is compared by embedding, so a followup is never reused for a
+    # different question or conversation
+    cache_key = "\0".join([training_data, conversation_context, previous_question])
+    return prompt, cache_key
 
 
 
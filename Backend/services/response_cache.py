@@ -0,0 +1,99 @@
+# Semantic Response Cache
+# Stores generated questions in SQLite next to the embedding of the request that produced them,
+# so a new request whose embedding is nearly identical to a recent one returns the stored
+# response instead of waiting for another Gemini generation
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Location of the cache database (kept next to the backend by default)
+CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.db")
+
+# Minimum cosine similarity for two requests to share a response
+SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+
+# Seconds a cached response may be reused
+TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+
+# A single shared connection guarded by a lock; requests are handled in worker threads
+_lock = threading.Lock()
+_conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+_conn.execute("PRAGMA journal_mode=WAL")
+_conn.execute("""
+    CREATE TABLE IF NOT EXISTS response_cache (
+        id INTEGER PRIMARY KEY,
+        namespace TEXT NOT NULL,
+        ts REAL NOT NULL,
+        vec BLOB NOT NULL,
+        response TEXT NOT NULL
+    )
+""")
+_conn.execute("CREATE INDEX IF NOT EXISTS response_cache_namespace ON response_cache (namespace, ts)")
+_conn.commit()
+
+
+def _unit(vec):
+    """Return vec as a float32 array scaled to unit length"""
+    vec = np.asarray(vec, dtype=np.float32)
+    return vec / (np.linalg.norm(vec) or 1.0)
+
+
+def lookup(namespace, embedding=None):
+    """
+    Find the response to the most similar recent request
+
+    Args:
+        namespace (str): Cache partition (e.g. question type and notes the prompt was built from)
+        embedding (np.ndarray or list, optional): Embedding of the new request; without one
+                                                  the namespace alone identifies the request
+
+    Returns:
+        str or None: The cached response if a request in the namespace younger than TTL
+                     has cosine similarity >= SIMILARITY_THRESHOLD (or, without an
+                     embedding, the newest response in the namespace), otherwise None
+    """
+    with _lock:
+        rows = _conn.execute(
+            "SELECT vec, response FROM response_cache WHERE namespace = ? AND ts >= ? ORDER BY ts DESC",
+            [namespace, time.time() - TTL]
+        ).fetchall()
+
+    if not rows:
+        return None
+    if embedding is None:
+        return rows[0][1]
+
+    # Stored vectors are unit length, so one matrix-vector product gives every cosine similarity
+    matrix = np.vstack([np.frombuffer(vec, dtype=np.float32) for vec, _ in rows])
+    scores = matrix @ _unit(embedding)
+    best = int(np.argmax(scores))
+
+    return rows[best][1] if scores[best] >= SIMILARITY_THRESHOLD else None
+
+
+def store(namespace, embedding, response):
+    """
+    Save a generated response under the embedding of its request
+
+    Args:
+        namespace (str): Cache partition, as passed to lookup
+        embedding (np.ndarray or list or None): Embedding of the request, or None for
+                                                namespaces that are looked up without one
+        response (str): Generated response text
+
+    Note:
+        Expired entries are removed on every insert, which keeps the table small.
+    """
+    now = time.time()
+
+    with _lock:
+        _conn.execute("DELETE FROM response_cache WHERE ts < ?", [now - TTL])
+        _conn.execute(
+            "INSERT INTO response_cache (namespace, ts, vec, response) VALUES (?, ?, ?, ?)",
+            [namespace, now, b"" if embedding is None else _unit(embedding).tobytes(), response]
+        )
+        _conn.commit()
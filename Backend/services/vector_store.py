@@ -0,0 +1,16 @@
+# Vector Store Selection
+# Exposes the storage functions of the configured vector database backend
+# VECTOR_STORE=chroma (default) uses ChromaDB, VECTOR_STORE=faiss uses the FAISS + SQLite store
+
+import os
+
+if os.getenv("VECTOR_STORE", "chroma").lower() == "faiss":
+    from .faiss_store import (
+        add_to_db, clear_collection, delete_document, flush,
+        get_all_documents, get_collection_version, get_document_chunks, get_notes
+    )
+else:
+    from .chroma_utils import (
+        add_to_db, clear_collection, delete_document, flush,
+        get_all_documents, get_collection_version, get_document_chunks, get_notes
+    )
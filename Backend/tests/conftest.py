@@ -0,0 +1,18 @@
+# Test setup
+# Services open their SQLite files and vector store when imported, so everything is
+# pointed at a scratch directory before any test module imports them
+
+import os
+import sys
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="recallify-tests-")
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ["VECTOR_STORE"] = "faiss"
+os.environ["FAISS_DIR"] = os.path.join(_scratch, "faiss_store")
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(_scratch, "embedding_cache.db")
+os.environ["RESPONSE_CACHE_PATH"] = os.path.join(_scratch, "response_cache.db")
+
+# Tests import the backend modules the same way main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,57 @@
+# Tests for the page-by-page chunker
+
+import random
+
+from services.pdf_processor import chunk_text, iter_chunks
+
+
+def _reference_chunk_text(text, max_tokens=300):
+    """The original whole-text chunker that iter_chunks must reproduce"""
+    chunks = []
+    chunk = []
+    token_count = 0
+
+    for sentence in text.split('. '):
+        token_count += len(sentence.split())
+        chunk.append(sentence)
+
+        if token_count >= max_tokens:
+            chunks.append('. '.join(chunk))
+            chunk = []
+            token_count = 0
+
+    if chunk:
+        chunks.append('. '.join(chunk))
+
+    return chunks
+
+
+def _random_page(rng):
+    """Page text mixing words, '. ' separators, dots without a space and line breaks"""
+    pieces = rng.choices(["word", "x", " ", "  ", ". ", ".", "\n", "end.", " .", ". \n"], k=rng.randint(0, 40))
+    return "".join(pieces)
+
+
+def test_iter_chunks_matches_the_original_chunker():
+    rng = random.Random(1234)
+
+    for _ in range(20000):
+        pages = [_random_page(rng) for _ in range(rng.randint(0, 6))]
+        max_tokens = rng.randint(1, 12)
+
+        expected = _reference_chunk_text("\n".join(pages), max_tokens)
+        assert list(iter_chunks(pages, max_tokens)) == expected, (pages, max_tokens)
+
+
+def test_chunk_text_matches_the_original_chunker():
+    rng = random.Random(99)
+
+    for _ in range(2000):
+        text = "".join(_random_page(rng) for _ in range(rng.randint(1, 4)))
+        assert chunk_text(text, 5) == _reference_chunk_text(text, 5)
+
+
+def test_long_run_without_separators_stays_one_chunk():
+    pages = ["no separator on this page"] * 2000
+
+    assert list(iter_chunks(pages)) == ["\n".join(pages)]
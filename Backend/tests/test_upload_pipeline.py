@@ -0,0 +1,93 @@
+# Tests for the upload pipeline in main.process_pdf
+# Parsing, embedding and storing are replaced by in-memory fakes, so no PDF,
+# Gemini API key or vector database is needed
+
+import asyncio
+import random
+import time
+
+import pytest
+
+import main
+from services.pdf_processor import chunk_text
+
+PAGES = ["a b c. d e f. g", "h i. j k l. m n o. p"] * 3000
+
+
+def _fake_embeddings(fail_at=None, delay=0.01):
+    """aget_embeddings replacement that records each batch start and can fail on one"""
+    calls = []
+
+    async def aget_embeddings(chunked_text, document_id=None, start=0):
+        calls.append(start)
+        if fail_at is not None and start >= fail_at:
+            await asyncio.sleep(0.02)
+            raise ValueError("embedding failed")
+        await asyncio.sleep(random.random() * delay)
+        return [
+            {"id": f"{document_id}_{index}", "text": chunk, "embedding": [1.0]}
+            for index, chunk in enumerate(chunked_text, start=start)
+        ]
+
+    return aget_embeddings, calls
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Run process_pdf on PAGES with small batches; returns the list of stored chunks"""
+    stored = []
+    monkeypatch.setattr(main, "iter_pdf_pages", lambda path: iter(PAGES))
+    monkeypatch.setattr(main, "EMBED_BATCH_SIZE", 3)
+    monkeypatch.setattr(main, "INSERT_BATCH_SIZE", 7)
+    monkeypatch.setattr(main, "add_to_db", lambda chunks, *args: stored.extend(chunks))
+    monkeypatch.setattr(main, "flush", lambda: None)
+    return stored
+
+
+def _stored_indexes(stored):
+    return [int(chunk["id"].rsplit("_", 1)[1]) for chunk in stored]
+
+
+def test_chunks_are_stored_in_document_order(pipeline, monkeypatch):
+    aget_embeddings, _ = _fake_embeddings()
+    monkeypatch.setattr(main, "aget_embeddings", aget_embeddings)
+
+    text, chunks = asyncio.run(main.process_pdf("upload.pdf", "doc"))
+
+    assert text == "\n".join(PAGES)
+    assert chunks == chunk_text(text)
+    assert _stored_indexes(pipeline) == list(range(len(chunks)))
+
+
+def test_first_failing_batch_stops_the_pipeline(pipeline, monkeypatch):
+    aget_embeddings, calls = _fake_embeddings(fail_at=30)
+    monkeypatch.setattr(main, "aget_embeddings", aget_embeddings)
+
+    with pytest.raises(ValueError, match="embedding failed"):
+        asyncio.run(main.process_pdf("upload.pdf", "doc"))
+
+    total_batches = -(-len(chunk_text("\n".join(PAGES))) // 3)
+    assert len(calls) < total_batches / 2
+    # Nothing after the failed batch is stored
+    assert all(index < 30 for index in _stored_indexes(pipeline))
+
+
+def test_running_write_finishes_before_the_error_is_raised(pipeline, monkeypatch):
+    aget_embeddings, _ = _fake_embeddings(fail_at=21, delay=0)
+    monkeypatch.setattr(main, "aget_embeddings", aget_embeddings)
+
+    def slow_add_to_db(chunks, *args):
+        time.sleep(0.2)
+        pipeline.extend(chunks)
+
+    monkeypatch.setattr(main, "add_to_db", slow_add_to_db)
+
+    async def upload():
+        with pytest.raises(ValueError):
+            await main.process_pdf("upload.pdf", "doc")
+        # Cleanup (delete_document) runs at this point and must see every stored chunk
+        stored_at_error = len(pipeline)
+        await asyncio.sleep(0.5)
+        return stored_at_error
+
+    assert asyncio.run(upload()) == len(pipeline) > 0